@@ -13,8 +13,12 @@ Key Features:
 import streamlit as st
 import tempfile
 import os
+import asyncio
+import itertools
+from collections import deque
 from coordinator_agent import handle_uploads_and_query
 from mcp import send_mcp_message
+from retrieval_agent import RetrievalAgent
 
 # -------------------------------
 # Streamlit Page Configuration
@@ -25,21 +29,30 @@ st.title("Agentic RAG Chatbot — Demo (MCP visible)")
 # -------------------------------
 # Session State Initialization
 # -------------------------------
+# Bounded so long sessions don't accumulate (and re-render) every message ever sent
+MCP_LOG_MAXLEN = 200
+CHAT_HISTORY_MAXLEN = 100
+
 if "mcp_log" not in st.session_state:
-    st.session_state["mcp_log"] = []  # stores MCP messages for UI display
+    st.session_state["mcp_log"] = deque(maxlen=MCP_LOG_MAXLEN)  # stores MCP messages for UI display
 
 if "chat_history" not in st.session_state:
-    st.session_state["chat_history"] = []  # keeps conversation turns: {"user":..., "assistant":...}
+    st.session_state["chat_history"] = deque(maxlen=CHAT_HISTORY_MAXLEN)  # keeps conversation turns: {"user":..., "assistant":...}
 
 def add_mcp_to_state(msg: dict):
     """Helper to append MCP message to Streamlit session state."""
     st.session_state["mcp_log"].append(msg)
 
+@st.cache_resource
+def get_agent() -> RetrievalAgent:
+    """Embedding model + FAISS index, shared across reruns instead of rebuilt each time."""
+    return RetrievalAgent()
+
 # -------------------------------
 # Sidebar: MCP Logs
 # -------------------------------
 st.sidebar.header("MCP Message Log")
-st.sidebar.write("MCP messages are also printed in the terminal. "
+st.sidebar.write("With MCP_DEBUG=1, MCP messages are also printed in the terminal. "
                  "This panel shows the last messages for convenience in demos.")
 
 # -------------------------------
@@ -84,7 +97,7 @@ with col1:
         add_mcp_to_state(m)
 
         # 2. Orchestrate flow (IngestionAgent → RetrievalAgent → LLMResponseAgent)
-        resp = handle_uploads_and_query(saved_paths, query)
+        resp = asyncio.run(handle_uploads_and_query(saved_paths, query, agent=get_agent()))
 
         # 3. Store in conversation history
         st.session_state["chat_history"].append({
@@ -101,18 +114,18 @@ with col1:
 # -------------------------------
 with col2:
     st.subheader("Conversation (latest turns)")
-    for turn in reversed(st.session_state["chat_history"][-20:]):
+    for turn in itertools.islice(reversed(st.session_state["chat_history"]), 20):
         st.markdown(f"**You:** {turn['user']}")
         st.markdown(f"**Assistant:** {turn['assistant']}")
 
     st.write("---")
     st.subheader("MCP Log (last 10 messages)")
-    # Note: MCP messages are also printed to terminal for easier PPT/video capture
-    for msg in st.session_state["mcp_log"][-10:]:
+    # Note: with MCP_DEBUG=1, MCP messages are also printed to terminal for easier PPT/video capture
+    for msg in list(st.session_state["mcp_log"])[-10:]:
         st.json(msg)
 
 # -------------------------------
 # Sidebar Footer Note
 # -------------------------------
-st.sidebar.write("💡 Tip: Run this app from a terminal so MCP messages printed to console "
+st.sidebar.write("💡 Tip: Run this app from a terminal with MCP_DEBUG=1 so MCP messages printed to console "
                  "are visible for your PPT/video demo.")
@@ -12,35 +12,109 @@ It acts as the "conductor" that connects the individual agents:
 The CoordinatorAgent ensures that:
 - All MCP messages are sent between agents.
 - The pipeline runs in the correct order (Ingest → Index → Retrieve → Answer).
+- Independent work overlaps: the query is embedded while documents are being parsed.
 """
 
-from typing import List, Dict
+import os
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Optional
 from mcp import send_mcp_message
-from ingestion_agent import process_document
-from retrieval_agent import index_chunks, handle_query
+from ingestion_agent import process_document, init_worker
+from retrieval_agent import RetrievalAgent, get_agent, index_chunks, handle_query, is_indexed
 from llm_response_agent import answer_query
 
+# Parsing workers are started on first use and kept for the life of the process.
+# They must not be forked from this process: the query may be embedding in another
+# thread (torch, tokenizers) at that moment. forkserver/spawn start clean workers.
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
 
-def handle_uploads_and_query(file_paths: List[str], query: str) -> Dict:
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context(_POOL_START_METHOD),
+            initializer=init_worker,
+        )
+    return _parse_pool
+
+
+def _file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+async def _parse_documents(paths: List[str]) -> List[List[Dict]]:
+    """
+    Parse documents with IngestionAgent, one file per worker process.
+    A single file is parsed in a worker thread, so one-file uploads never start the pool.
+    If the pool is broken (a worker died or init_worker failed) it is discarded and the
+    batch is parsed serially in a thread; the next upload starts a fresh pool.
+    """
+    global _parse_pool
+    if not paths:
+        return []
+    loop = asyncio.get_running_loop()
+    if len(paths) == 1:
+        return [await loop.run_in_executor(None, process_document, paths[0], paths[0])]
+    pool = _get_parse_pool()
+    try:
+        return await asyncio.gather(*(loop.run_in_executor(pool, process_document, p, p) for p in paths))
+    except BrokenProcessPool as e:
+        logging.warning("CoordinatorAgent: parsing pool broke (%s); parsing %d files serially", e, len(paths))
+        if _parse_pool is pool:
+            _parse_pool = None
+        pool.shutdown(wait=False)
+        return await loop.run_in_executor(None, lambda: [process_document(p, p) for p in paths])
+
+
+async def handle_uploads_and_query(file_paths: List[str], query: str, agent: RetrievalAgent = None) -> Dict:
     """
     Orchestrate the end-to-end pipeline for a user query.
 
     Args:
         file_paths (List[str]): List of file paths uploaded by the user.
         query (str): Natural language query from the user.
+        agent (RetrievalAgent, optional): Agent holding the index. Defaults to the module-level agent.
 
     Returns:
         Dict: Final response object with answer + retrieved context.
     """
+    agent = agent or get_agent()
+    loop = asyncio.get_running_loop()
+
+    # Embed the query in a worker thread while the documents are hashed and parsed
+    query_vec = loop.run_in_executor(None, agent.encode_queries, [query])
 
     # -------------------------------
     # Step 1: Ingest all files
     # -------------------------------
-    all_chunks = []
+    # Uploads are keyed by content hash: Streamlit saves every upload to a fresh
+    # temp path on each rerun, so the path itself cannot identify a document.
+    pending = {}  # content hash -> path, for documents not indexed yet
     for p in file_paths:
-        # Each document is parsed and split into chunks by IngestionAgent
-        chunks = process_document(p, filename=p)
-        all_chunks.extend(chunks)
+        sha = _file_sha1(p)
+        # Documents indexed by an earlier query need neither parsing nor embedding
+        if sha in pending or is_indexed(sha, agent=agent):
+            continue
+        pending[sha] = p
+
+    # Each document is parsed and split into chunks by IngestionAgent (in parallel)
+    parsed = await _parse_documents(list(pending.values()))
+
+    # A document that failed to parse (no chunks) is not marked as indexed, so it is retried next time
+    new_hashes = [sha for sha, chunks in zip(pending, parsed) if chunks]
+    all_chunks = [c for chunks in parsed for c in chunks]
 
     # Send MCP message: Coordinator → RetrievalAgent (index building)
     send_mcp_message(
@@ -53,13 +127,15 @@ def handle_uploads_and_query(file_paths: List[str], query: str) -> Dict:
     # -------------------------------
     # Step 2: Index chunks
     # -------------------------------
+    # Wait for the query embedding first so the model isn't running two encodes at once
+    q_vec = await query_vec
     if all_chunks:
-        index_chunks(all_chunks)
+        index_chunks(all_chunks, agent=agent, doc_hashes=new_hashes)
 
     # -------------------------------
     # Step 3: Retrieve relevant context
     # -------------------------------
-    retrieved = handle_query(query, top_k=5)
+    retrieved = handle_query(query, top_k=5, agent=agent, q_vec=q_vec)
 
     # -------------------------------
     # Step 4: Generate LLM answer
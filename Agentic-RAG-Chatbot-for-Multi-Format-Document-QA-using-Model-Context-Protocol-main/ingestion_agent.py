@@ -16,65 +16,168 @@ Each chunk is returned with metadata and an MCP message is sent to the Retrieval
 """
 
 import os
+import io
+import re
+import csv
+import itertools
 import logging
-from typing import List, Dict
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Dict, Tuple
 from mcp import send_mcp_message
 
 import fitz  # PDF (PyMuPDF)
 from pptx import Presentation
-import pandas as pd
 from docx import Document as DocxDocument
+from transformers import AutoTokenizer
 
 logging.basicConfig(level=logging.INFO)
-CHUNK_SIZE = 800  # Developer note: adjust for better tradeoff between granularity and context length
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"  # chunks are sized with the embedding model's tokenizer
+MAX_CHUNK_TOKENS = 254  # Developer note: MiniLM's 256-token window minus [CLS]/[SEP], so chunks are never truncated
+STREAM_BUFFER_CHARS = 16384  # streamed text is chunked once this much is buffered
+CSV_PREVIEW_ROWS = 50
 
 
 # -------------------------------
 # Helpers: Chunking & Parsing
 # -------------------------------
-def _chunk_text(text: str, size: int = CHUNK_SIZE) -> List[str]:
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+@lru_cache(maxsize=None)
+def _get_tokenizer():
+    return AutoTokenizer.from_pretrained(EMBED_MODEL)
+
+
+def init_worker():
+    """
+    Process-pool initializer: load the tokenizer once per worker instead of once per document.
+    """
+    _get_tokenizer()
+
+
+def _split_long_sentence(sentence: str, tokenizer, max_tokens: int) -> Iterator[Tuple[str, int]]:
+    """
+    Cut a sentence that exceeds max_tokens on token boundaries.
+    Yields (text, n_tokens) pairs.
+    """
+    offsets = tokenizer(sentence, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    for k in range(0, len(offsets), max_tokens):
+        window = offsets[k:k + max_tokens]
+        yield sentence[window[0][0]:window[-1][1]], len(window)
+
+
+def _sentence_chunks(text: str, tokenizer, max_tokens: int = MAX_CHUNK_TOKENS) -> List[str]:
     """
-    Split text into chunks of fixed size.
+    Pack consecutive sentences into chunks of at most max_tokens tokens.
+    Each chunk end is found by binary search over cumulative sentence token counts.
     """
-    text = text.strip()
-    if not text:
+    # Stripped, so chunks carry no edge whitespace (which would change their dedupe hash)
+    sentences = [s.strip() for s in _SENTENCE_BREAK.split(text) if s and not s.isspace()]
+    if not sentences:
         return []
-    return [text[i:i+size] for i in range(0, len(text), size)]
+    counts = [len(ids) for ids in tokenizer(sentences, add_special_tokens=False)["input_ids"]]
 
+    pieces, cum = [], [0]
+    for sentence, n in zip(sentences, counts):
+        parts = [(sentence, n)] if n <= max_tokens else _split_long_sentence(sentence, tokenizer, max_tokens)
+        for part, n_part in parts:
+            pieces.append(part)
+            cum.append(cum[-1] + n_part)
 
-def parse_pdf(path: str) -> str:
-    doc = fitz.open(path)
-    pages = [p.get_text() for p in doc]
-    return "\n".join(pages)
+    chunks = []
+    i = 0
+    while i < len(pieces):
+        # Last piece j such that pieces[i:j] fits in max_tokens (always at least one piece)
+        j = max(bisect_right(cum, cum[i] + max_tokens) - 1, i + 1)
+        chunks.append(" ".join(pieces[i:j]))
+        i = j
+    return chunks
+
+
+class RollingChunker:
+    """
+    Turn streamed text into sentence-aligned, token-bounded chunks as it arrives.
+    Once enough text is buffered it is packed with _sentence_chunks; every chunk
+    except the last (which may still grow) is emitted right away.
+    """
+
+    def __init__(self, max_tokens: int = MAX_CHUNK_TOKENS, buffer_chars: int = STREAM_BUFFER_CHARS):
+        self.max_tokens = max_tokens
+        self.buffer_chars = buffer_chars
+        self.tokenizer = _get_tokenizer()
+        self._buf = ""
+
+    def feed(self, piece: str) -> List[str]:
+        """
+        Buffer a piece of text and return the chunks it completed (often none).
+        """
+        self._buf += piece
+        if len(self._buf) < self.buffer_chars:
+            return []
+        chunks = _sentence_chunks(self._buf, self.tokenizer, self.max_tokens)
+        # Carry the open chunk forward, keeping the whitespace that separates it from the next piece
+        trailing_ws = self._buf[len(self._buf.rstrip()):]
+        self._buf = chunks.pop() + trailing_ws if chunks else ""
+        return chunks
+
+    def flush(self) -> List[str]:
+        """
+        Return the chunks of whatever is still buffered.
+        """
+        chunks = _sentence_chunks(self._buf, self.tokenizer, self.max_tokens)
+        self._buf = ""
+        return chunks
+
+    def split(self, pieces: Iterable[str]) -> Iterator[str]:
+        for piece in pieces:
+            yield from self.feed(piece)
+        yield from self.flush()
+
+
+def _joined(parts: Iterable[str], sep: str) -> Iterator[str]:
+    """
+    Stream equivalent of sep.join(parts).
+    """
+    for i, part in enumerate(parts):
+        if i:
+            yield sep
+        yield part
 
 
-def parse_pptx(path: str) -> str:
+def iter_pdf_text(path: str) -> Iterator[str]:
+    with fitz.open(path) as doc:
+        yield from _joined((p.get_text() for p in doc), "\n")
+
+
+def iter_pptx_text(path: str) -> Iterator[str]:
     prs = Presentation(path)
-    slides_text = []
-    for idx, slide in enumerate(prs.slides):
-        parts = []
-        for shape in slide.shapes:
-            if hasattr(shape, "text") and shape.text:
-                parts.append(shape.text)
-        slides_text.append("\n".join(parts))
-    return "\n\n".join(slides_text)
+    slides_text = (
+        "\n".join(shape.text for shape in slide.shapes if hasattr(shape, "text") and shape.text)
+        for slide in prs.slides
+    )
+    yield from _joined(slides_text, "\n\n")
 
 
-def parse_docx(path: str) -> str:
+def iter_docx_text(path: str) -> Iterator[str]:
     doc = DocxDocument(path)
-    paras = [p.text for p in doc.paragraphs if p.text and p.text.strip()]
-    return "\n".join(paras)
+    paras = (p.text for p in doc.paragraphs if p.text and p.text.strip())
+    yield from _joined(paras, "\n")
 
 
-def parse_txt(path: str) -> str:
+def iter_txt_text(path: str, block_size: int = 1 << 16) -> Iterator[str]:
     with open(path, "r", encoding="utf-8", errors="ignore") as f:
-        return f.read()
+        yield from iter(lambda: f.read(block_size), "")
 
 
 def parse_csv(path: str) -> str:
-    df = pd.read_csv(path)
     # Developer note: limit to 50 rows for readability (prevents bloating chunks)
-    return df.head(50).to_csv(index=False)
+    # Only the header + 50 rows are read, however large the file is
+    with open(path, newline="", encoding="utf-8", errors="ignore") as f:
+        rows = list(itertools.islice(csv.reader(f), CSV_PREVIEW_ROWS + 1))
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue()
 
 
 # -------------------------------
@@ -93,25 +196,27 @@ def process_document(file_path: str, filename: str = None) -> List[Dict]:
 
     ext = os.path.splitext(filename)[1].lower()
     try:
+        # Text is streamed piece by piece (page, slide, ...) into the chunker
         if ext == ".pdf":
-            text = parse_pdf(file_path)
+            pieces = iter_pdf_text(file_path)
         elif ext in [".pptx", ".ppt"]:
-            text = parse_pptx(file_path)
+            pieces = iter_pptx_text(file_path)
         elif ext == ".docx":
-            text = parse_docx(file_path)
+            pieces = iter_docx_text(file_path)
         elif ext == ".csv":
-            text = parse_csv(file_path)
+            pieces = [parse_csv(file_path)]
         elif ext in [".txt", ".md"]:
-            text = parse_txt(file_path)
+            pieces = iter_txt_text(file_path)
         else:
             # Fallback: treat unknown format as text
-            text = parse_txt(file_path)
+            pieces = iter_txt_text(file_path)
+        texts = list(RollingChunker().split(pieces))
     except Exception as e:
         logging.exception("Error parsing %s: %s", file_path, e)
-        text = ""
+        texts = []
 
     chunks = []
-    for i, c in enumerate(_chunk_text(text)):
+    for i, c in enumerate(texts):
         chunks.append({"text": c, "meta": {"filename": filename, "chunk_index": i}})
 
     # Notify RetrievalAgent that parsing is complete
@@ -13,71 +13,108 @@ Always sends FINAL_RESPONSE MCP message back to the UI.
 
 import os
 import logging
+import threading
 from typing import Dict, List
 from mcp import send_mcp_message
 import requests
+from requests.adapters import HTTPAdapter
 import re
 
+try:
+    import hyperscan  # optional: linear-time automaton scans ahead of the backtracking regex searches
+except ImportError:
+    hyperscan = None
+
 logging.basicConfig(level=logging.INFO)
 
 # Environment variables
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/v1/llm")  # Developer note: replace with actual endpoint
 
+# Shared HTTP session: keep-alive connections are reused across LLM calls (no TCP/TLS handshake per query)
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20))
+
 
 # -------------------------------
 # Stub Answer Extraction
 # -------------------------------
+# Patterns are compiled once at import; extract_stub_answers runs on every stub-mode query.
+# Revenue: every "$X billion" figure, with the rest of its line (checked for the year) as a lookahead.
+_RE_REVENUE = re.compile(r"(\$[0-9.]+\s*billion)(?=([^\n]*))")
+_REVENUE_YEARS = ("2023", "2024")
+
+# (pattern, answer template) in priority order; group(1) is the extracted value
+_STUB_PATTERNS = [
+    (re.compile(r"CAC.*?(\$[0-9]+)", re.IGNORECASE), "Customer Acquisition Cost was {}"),
+    (re.compile(r"NPS.*?(\d{2})", re.IGNORECASE), "Net Promoter Score was {}"),
+    (re.compile(r"Retention rate was (\d+)%", re.IGNORECASE), "Retention rate was {}%"),
+    (re.compile(r"churn rate (?:decreased to|was) (\d+)%", re.IGNORECASE), "Churn rate was {}%"),
+    (re.compile(r"Employee satisfaction.*?(\d+)%", re.IGNORECASE), "Employee satisfaction score was {}%"),
+    (re.compile(r"carbon footprint.*?(\d+)%", re.IGNORECASE), "Carbon footprint reduced by {}%"),
+]
+
+
+def _compile_hyperscan_dbs():
+    """
+    Compile each of the _STUB_PATTERNS into its own Hyperscan database.
+    Separate databases because a combined one was seen to miss matches (e.g. the carbon
+    footprint pattern next to the CAC one); byte mode only agrees with `re` on ASCII text.
+    """
+    dbs = []
+    for p, _ in _STUB_PATTERNS:
+        flags = hyperscan.HS_FLAG_SINGLEMATCH | (hyperscan.HS_FLAG_CASELESS if p.flags & re.IGNORECASE else 0)
+        db = hyperscan.Database()
+        db.compile(expressions=[p.pattern.encode("ascii")], ids=[0], elements=1, flags=[flags])
+        dbs.append(db)
+    return dbs
+
+
+_HS_DBS = _compile_hyperscan_dbs() if hyperscan is not None else None
+# A scratch space can only be used by one scan at a time; Streamlit sessions run in separate threads
+_HS_LOCAL = threading.local()
+
+
+def _may_match(i: int, text: str) -> bool:
+    """
+    Linear-time Hyperscan check for whether _STUB_PATTERNS[i] matches somewhere in text,
+    so the backtracking `re` search only runs when it will succeed. True (try `re`) when
+    Hyperscan is unavailable or the text is not ASCII (`re`'s Unicode \\d and case folding differ).
+    """
+    if _HS_DBS is None or not text.isascii():
+        return True
+    scratches = getattr(_HS_LOCAL, "scratches", None)
+    if scratches is None:
+        scratches = _HS_LOCAL.scratches = [hyperscan.Scratch(db) for db in _HS_DBS]
+    hit = []
+    _HS_DBS[i].scan(text.encode("ascii"), match_event_handler=lambda *args: hit.append(True), scratch=scratches[i])
+    return bool(hit)
+
+
 def extract_stub_answers(text: str) -> str:
     """
     Extracts key metrics from retrieved text for stub mode.
     Useful for coding test demos without paid LLM API access.
     """
-    # Revenue 2023
-    match_2023 = re.search(r"\$[0-9.]+\s*billion.*2023", text)
-    if match_2023:
-        value = re.search(r"\$[0-9.]+\s*billion", match_2023.group())
-        if value:
-            return f"(Stub Answer) Revenue in 2023 was {value.group()}"
-
-    # Revenue 2024
-    match_2024 = re.search(r"\$[0-9.]+\s*billion.*2024", text)
-    if match_2024:
-        value = re.search(r"\$[0-9.]+\s*billion", match_2024.group())
-        if value:
-            return f"(Stub Answer) Revenue in 2024 was {value.group()}"
-
-    # CAC
-    match_cac = re.search(r"CAC.*?\$[0-9]+", text, re.IGNORECASE)
-    if match_cac:
-        value = re.search(r"\$[0-9]+", match_cac.group())
-        if value:
-            return f"(Stub Answer) Customer Acquisition Cost was {value.group()}"
-
-    # NPS
-    match_nps = re.search(r"NPS.*?(\d{2})", text, re.IGNORECASE)
-    if match_nps:
-        return f"(Stub Answer) Net Promoter Score was {match_nps.group(1)}"
-
-    # Retention
-    match_ret = re.search(r"Retention rate was (\d+)%", text, re.IGNORECASE)
-    if match_ret:
-        return f"(Stub Answer) Retention rate was {match_ret.group(1)}%"
-
-    # Churn
-    match_churn = re.search(r"churn rate (decreased to|was) (\d+)%", text, re.IGNORECASE)
-    if match_churn:
-        return f"(Stub Answer) Churn rate was {match_churn.group(2)}%"
-
-    # Employee satisfaction
-    match_emp = re.search(r"Employee satisfaction.*?(\d+)%", text, re.IGNORECASE)
-    if match_emp:
-        return f"(Stub Answer) Employee satisfaction score was {match_emp.group(1)}%"
-
-    # Carbon footprint
-    match_carbon = re.search(r"carbon footprint.*?(\d+)%", text, re.IGNORECASE)
-    if match_carbon:
-        return f"(Stub Answer) Carbon footprint reduced by {match_carbon.group(1)}%"
+    # Revenue 2023 / 2024: a single scan, remembering the first figure for each year
+    revenue = {}
+    for m in _RE_REVENUE.finditer(text):
+        for year in _REVENUE_YEARS:
+            if year not in revenue and year in m.group(2):
+                revenue[year] = m.group(1)
+        if len(revenue) == len(_REVENUE_YEARS):
+            break
+    for year in _REVENUE_YEARS:
+        if year in revenue:
+            return f"(Stub Answer) Revenue in {year} was {revenue[year]}"
+
+    # CAC, NPS, retention, churn, employee satisfaction, carbon footprint
+    for i, (pattern, template) in enumerate(_STUB_PATTERNS):
+        if not _may_match(i, text):
+            continue
+        match = pattern.search(text)
+        if match:
+            return "(Stub Answer) " + template.format(match.group(1))
 
     # Fallback: just preview
     short_preview = text[:400].replace("\n", " ")
@@ -105,7 +142,7 @@ def call_llm(prompt: str, retrieved: List[Dict], max_tokens: int = 512) -> Dict:
     payload = {"prompt": prompt, "max_tokens": max_tokens}
 
     try:
-        resp = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=30)
+        resp = _SESSION.post(GROQ_API_URL, headers=headers, json=payload, timeout=30)
         resp.raise_for_status()
         data = resp.json()
         answer = data.get("output", data.get("answer", ""))
@@ -119,15 +156,19 @@ def call_llm(prompt: str, retrieved: List[Dict], max_tokens: int = 512) -> Dict:
 # Prompt Formatting
 # -------------------------------
 def format_prompt(query: str, retrieved: List[Dict]) -> str:
-    builder = []
-    builder.append("You are a helpful assistant. Use only the context below to answer the question. If the answer is not present, say you don't know.")
-    builder.append(f"\n### Query:\n{query}\n")
-    builder.append("### Context (top chunks):\n")
-    for i, r in enumerate(retrieved):
-        meta = r.get("meta", {})
-        builder.append(f"[Chunk {i}] source={meta.get('filename')} idx={meta.get('chunk_index')} score={r.get('score')}\n{r.get('text')}\n---\n")
-    builder.append("\nProvide a concise answer, and list which chunk(s) were used as sources (by filename + chunk_index).")
-    return "\n".join(builder)
+    context = "".join(
+        f"\n[Chunk {i}] source={r.get('meta', {}).get('filename')} idx={r.get('meta', {}).get('chunk_index')} "
+        f"score={r.get('score')}\n{r.get('text')}\n---\n"
+        for i, r in enumerate(retrieved)
+    )
+    return (
+        "You are a helpful assistant. Use only the context below to answer the question. "
+        "If the answer is not present, say you don't know.\n"
+        f"\n### Query:\n{query}\n"
+        "\n### Context (top chunks):\n"
+        f"{context}"
+        "\n\nProvide a concise answer, and list which chunk(s) were used as sources (by filename + chunk_index)."
+    )
 
 
 # -------------------------------
@@ -143,12 +184,13 @@ def answer_query(query: str, retrieved: List[Dict]) -> Dict:
     llm_resp = call_llm(prompt, retrieved)
     answer = llm_resp.get("answer", "")
 
-    # Send MCP back to UI
+    # Send MCP back to UI (sources only: the chunk texts were already sent in RETRIEVAL_RESULT)
+    sources = [{"meta": r.get("meta", {}), "score": r.get("score")} for r in retrieved]
     send_mcp_message(
         sender="LLMResponseAgent",
         receiver="UI",
         type="FINAL_RESPONSE",
-        payload={"query": query, "answer": answer, "retrieved": retrieved, "llm_raw": llm_resp.get("raw")}
+        payload={"query": query, "answer": answer, "retrieved": sources, "llm_raw": llm_resp.get("raw")}
     )
 
     return {"answer": answer, "retrieved": retrieved}
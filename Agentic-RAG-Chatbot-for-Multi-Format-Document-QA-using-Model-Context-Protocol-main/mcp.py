@@ -6,6 +6,7 @@ This module defines helper functions to create and send MCP messages.
 MCP ensures structured communication between agents and the UI.
 """
 
+import os
 import json
 import uuid
 import logging
@@ -13,6 +14,9 @@ from typing import Any, Dict
 
 logging.basicConfig(level=logging.INFO)
 
+# Full JSON dump of every message to the console (demo/debugging only): MCP_DEBUG=1
+_MCP_DEBUG = os.getenv("MCP_DEBUG") == "1"
+
 
 def make_trace_id(prefix: str = "rag") -> str:
     """
@@ -46,9 +50,10 @@ def send_mcp_message(sender: str, receiver: str, type: str, payload: Dict[str, A
         "payload": payload,
     }
 
-    # Console print for demo purposes
-    print("\n📩 MCP MESSAGE:")
-    print(json.dumps(message, indent=2, ensure_ascii=False))
+    # Console print for demo purposes (payloads can hold whole retrieved chunks, so opt-in)
+    if _MCP_DEBUG:
+        print("\n📩 MCP MESSAGE:")
+        print(json.dumps(message, indent=2, ensure_ascii=False))
 
     logging.info("MCP message: %s -> %s : %s", sender, receiver, type)
     return message
@@ -11,89 +11,378 @@ Flow:
 3. Send MCP message with retrieved context to LLMResponseAgent
 """
 
+import os
+import pickle
+import hashlib
 import logging
-from typing import List, Dict
+import tempfile
+import threading
+from functools import lru_cache
+from typing import Iterable, List, Dict, Optional, Set
 from mcp import send_mcp_message
+from ingestion_agent import EMBED_MODEL, MAX_CHUNK_TOKENS
 
 from sentence_transformers import SentenceTransformer
 import numpy as np
 import faiss
+import torch
 
 logging.basicConfig(level=logging.INFO)
 
-EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 EMBED_DIM = 384
+ENCODE_BATCH_SIZE = 64
+QUERY_BATCH_SIZE = 32
+# Reduced-precision inference: FP16 on GPU, dynamic int8 Linear layers on CPU
+EMBED_QUANTIZE = os.getenv("EMBED_QUANTIZE", "1") == "1"
+EMBED_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+EMBED_PRECISION = ("fp16" if EMBED_DEVICE == "cuda" else "int8") if EMBED_QUANTIZE else "fp32"
+
+# IVF index with 8-bit scalar-quantized vectors (4x smaller than FP32, near-identical
+# recall for MiniLM cosine). Chunks are kept in an exact flat index until there are
+# enough vectors to train the coarse quantizer (~39 training points per list).
+INDEX_FACTORY = "IVF256,SQ8"
+INDEX_NLIST = 256
+INDEX_NPROBE = 16
+MIN_TRAIN_VECTORS = INDEX_NLIST * 39
+
+# Saved index (+ a pickle sidecar with texts/metadata) so restarts reload instead of re-embedding.
+# Set RAG_INDEX_PATH to an empty string to keep the index in memory only.
+INDEX_PATH = os.getenv("RAG_INDEX_PATH", os.path.join("faiss_index", "index.faiss"))
+
+
+def _index_config() -> Dict:
+    """
+    Settings that determine the stored vectors and chunks. A saved index is only
+    reused when these match, so vectors from different models/precisions/chunkers never mix.
+    """
+    return {"embed_model": EMBED_MODEL, "embed_precision": EMBED_PRECISION, "max_chunk_tokens": MAX_CHUNK_TOKENS}
+
+
+def _temp_path(path: str) -> str:
+    """
+    Unique temp file next to `path`, so concurrent writers never share one.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    return tmp
+
+
+@lru_cache(maxsize=None)
+def load_embed_model() -> SentenceTransformer:
+    """
+    Load the embedding model once per process and share it between agents.
+    Set EMBED_QUANTIZE=0 to keep full FP32 weights.
+    """
+    if EMBED_DEVICE == "cuda":
+        model = SentenceTransformer(EMBED_MODEL, device="cuda")
+        if EMBED_QUANTIZE:
+            model.half()
+    else:
+        model = SentenceTransformer(EMBED_MODEL, device="cpu")
+        if EMBED_QUANTIZE:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
 
 
 class RetrievalAgent:
-    def __init__(self):
+    def __init__(self, nprobe: int = INDEX_NPROBE, index_path: Optional[str] = INDEX_PATH):
         # Load embedding model
-        self.model = SentenceTransformer(EMBED_MODEL)
+        self.model = load_embed_model()
+        self.nprobe = nprobe  # IVF lists scanned per query (recall vs. latency)
+        self.index_path = index_path
+        # One agent is shared by every Streamlit session: index updates, saves and searches are serialized
+        self._lock = threading.RLock()
+        # With a GPU build of FAISS the index lives on GPU 0 (IVF training and saving go through CPU)
+        self._gpu_res = faiss.StandardGpuResources() if faiss.get_num_gpus() > 0 else None
+        self._reset()
+
+        if index_path and os.path.exists(index_path):
+            self.load(index_path)
+
+    def _reset(self):
+        """
+        Start from an empty index.
+        """
         self.index = None
-        self.metadatas: List[Dict] = []
-        self.texts: List[str] = []
+        self.is_ivf = False
+        # Chunk data as parallel arrays (row i <-> FAISS id i) instead of one dict per chunk
+        self.texts = np.empty(0, dtype=object)
+        self.filenames = np.empty(0, dtype=object)
+        self.chunk_indices = np.empty(0, dtype=np.int32)
+        self._indexed_docs: Set[str] = set()  # content hashes of documents already in the index
+        self._seen: Set[bytes] = set()  # content hashes of chunk texts already in the index
+        self._mmap_path: Optional[str] = None  # set while self.index is a read-only mmap of a saved file
+
+    def _to_device(self, index):
+        """
+        Copy a CPU index to the GPU when one is available.
+        """
+        if self._gpu_res is None:
+            return index
+        return faiss.index_cpu_to_gpu(self._gpu_res, 0, index)
 
-    def build_index(self, chunks: List[Dict]):
+    def is_indexed(self, doc_hash: str) -> bool:
+        """
+        Whether a document with this content hash has already been indexed.
+        """
+        return doc_hash in self._indexed_docs
+
+    def build_index(self, chunks: List[Dict], doc_hashes: Iterable[str] = ()):
         """
         Build or extend FAISS index with new chunks.
+        doc_hashes identifies the documents the chunks came from, so they are not indexed twice.
+        Chunks whose exact text is already indexed are skipped.
+        """
+        doc_hashes = list(doc_hashes)
+        new_keys = {}
+        with self._lock:
+            for c in chunks:
+                key = hashlib.blake2b(c["text"].encode("utf-8"), digest_size=16).digest()
+                if key not in self._seen and key not in new_keys:
+                    new_keys[key] = c
+            if not new_keys:
+                self._mark_indexed(doc_hashes)
+                logging.info("RetrievalAgent: no new chunks to index")
+                return
+
+        # Encode outside the lock so other sessions can keep searching meanwhile
+        texts = [c["text"] for c in new_keys.values()]
+        # One batched encode for every new chunk; SBERT normalizes so IP == cosine
+        vectors = self.model.encode(texts, batch_size=ENCODE_BATCH_SIZE, convert_to_numpy=True,
+                                    normalize_embeddings=True, show_progress_bar=False)
+        vectors = np.asarray(vectors, dtype="float32")  # FAISS needs FP32 even from an FP16 model
+
+        with self._lock:
+            self._add(new_keys, vectors, doc_hashes)
+
+    def _mark_indexed(self, doc_hashes: List[str]):
+        """
+        Record documents whose chunks are all already indexed, and persist that. Caller holds self._lock.
         """
+        if set(doc_hashes) <= self._indexed_docs:
+            return
+        self._indexed_docs.update(doc_hashes)
+        if self.index_path and self.index is not None:
+            self.save(self.index_path)
+
+    def _add(self, new_keys: Dict[bytes, Dict], vectors: np.ndarray, doc_hashes: List[str]):
+        """
+        Add encoded chunks to the index and save it. Caller holds self._lock.
+        """
+        # Another session may have indexed some of the same chunks while these were being encoded
+        keep = [i for i, key in enumerate(new_keys) if key not in self._seen]
+        if not keep:
+            self._mark_indexed(doc_hashes)
+            return
+        keys = list(new_keys)
+        keys = [keys[i] for i in keep]
+        chunks = [new_keys[k] for k in keys]
         texts = [c["text"] for c in chunks]
-        vectors = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
-        vectors = np.array(vectors).astype("float32")
-        faiss.normalize_L2(vectors)
+        vectors = vectors[keep]
 
         if self.index is None:
-            self.index = faiss.IndexFlatIP(EMBED_DIM)
+            self.index = self._to_device(faiss.IndexFlatIP(EMBED_DIM))
+        elif self._mmap_path is not None:
+            # A memory-mapped index is read-only: load a writable copy before adding
+            self.index = faiss.read_index(self._mmap_path)
+            self._mmap_path = None
 
         self.index.add(vectors)
-        self.texts.extend(texts)
-        for c in chunks:
-            self.metadatas.append(c.get("meta", {}))
+        if not self.is_ivf and self.index.ntotal >= MIN_TRAIN_VECTORS:
+            self._build_ivf()
+
+        metas = [c.get("meta", {}) for c in chunks]
+        self.texts = np.concatenate([self.texts, np.array(texts, dtype=object)])
+        self.filenames = np.concatenate([self.filenames, np.array([m.get("filename") for m in metas], dtype=object)])
+        self.chunk_indices = np.concatenate([
+            self.chunk_indices, np.array([m.get("chunk_index", -1) for m in metas], dtype=np.int32)
+        ])
+        self._seen.update(keys)
+        self._indexed_docs.update(doc_hashes)
 
         logging.info("RetrievalAgent: index size now %d", self.index.ntotal)
+        if self.index_path:
+            self.save(self.index_path)
+
+    def save(self, path: str):
+        """
+        Write the FAISS index to `path` and texts/metadata to `path + ".meta.pkl"`.
+        Each file is written to a unique temp file and then replaced atomically, so a
+        process that has the old index mapped is unaffected.
+        """
+        with self._lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            # write_index on a memory-mapped IVF index writes a stub without the vector codes,
+            # so never write one: if it is already the file at `path` only the sidecar changes
+            write_index = self._mmap_path is None or not (
+                os.path.exists(path) and os.path.samefile(self._mmap_path, path))
+            if write_index and self._mmap_path is not None:
+                self.index = faiss.read_index(self._mmap_path)
+                self._mmap_path = None
+            cpu_index = faiss.index_gpu_to_cpu(self.index) if self._gpu_res is not None else self.index
+            index_tmp = _temp_path(path) if write_index else None
+            meta_tmp = _temp_path(path + ".meta.pkl")
+            try:
+                if write_index:
+                    faiss.write_index(cpu_index, index_tmp)
+                with open(meta_tmp, "wb") as f:
+                    pickle.dump({
+                        "config": _index_config(),
+                        "texts": self.texts,
+                        "filenames": self.filenames,
+                        "chunk_indices": self.chunk_indices,
+                        "indexed_docs": self._indexed_docs,
+                        "seen": self._seen,
+                    }, f, protocol=pickle.HIGHEST_PROTOCOL)
+                if write_index:
+                    os.replace(index_tmp, path)
+                os.replace(meta_tmp, path + ".meta.pkl")
+            finally:
+                for tmp in (index_tmp, meta_tmp):
+                    if tmp and os.path.exists(tmp):
+                        os.remove(tmp)
+
+    def load(self, path: str) -> bool:
+        """
+        Memory-map an index written by save() (read-only until the next build_index) and load its sidecar.
+        On GPU the index is copied to device memory instead.
+        A missing, unreadable or mismatched index is ignored (with a warning) and False is returned;
+        the agent then starts empty and the next build_index overwrites the files.
+        """
+        try:
+            with open(path + ".meta.pkl", "rb") as f:
+                state = pickle.load(f)
+            if state.get("config") != _index_config():
+                logging.warning("RetrievalAgent: ignoring %s, saved with different settings %s",
+                                path, state.get("config"))
+                return False
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            sizes = {index.ntotal, len(state["texts"]), len(state["filenames"]), len(state["chunk_indices"])}
+            if len(sizes) != 1:
+                # e.g. a crash between replacing the index and its sidecar
+                logging.warning("RetrievalAgent: ignoring %s, index (%d vectors) and sidecar (%d texts) disagree",
+                                path, index.ntotal, len(state["texts"]))
+                return False
+        except Exception as e:
+            logging.warning("RetrievalAgent: could not load %s (%s); starting with an empty index", path, e)
+            return False
+
+        with self._lock:
+            self._reset()
+            self.texts = state["texts"]
+            self.filenames = state["filenames"]
+            self.chunk_indices = state["chunk_indices"]
+            self._indexed_docs = state["indexed_docs"]
+            self._seen = state["seen"]
+
+            ivf = faiss.try_extract_index_ivf(index)
+            self.is_ivf = ivf is not None
+            if ivf is not None:
+                ivf.nprobe = self.nprobe
+            self.index = self._to_device(index)
+            self._mmap_path = path if self._gpu_res is None else None
+        logging.info("RetrievalAgent: loaded %d vectors from %s", self.index.ntotal, path)
+        return True
+
+    def _build_ivf(self):
+        """
+        Replace the flat buffer index with a trained IVF-SQ8 index.
+        """
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        index = faiss.index_factory(EMBED_DIM, INDEX_FACTORY, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.add(vectors)
+        faiss.extract_index_ivf(index).nprobe = self.nprobe  # copied along to the GPU index
+
+        self.index = self._to_device(index)
+        self.is_ivf = True
+        logging.info("RetrievalAgent: trained %s on %d vectors", INDEX_FACTORY, len(vectors))
 
     def retrieve(self, query: str, top_k: int = 5) -> List[Dict]:
         """
         Retrieve top-k most relevant chunks for a query.
         """
-        if self.index is None or self.index.ntotal == 0:
-            return []
+        return self.retrieve_batch([query], top_k=top_k)[0]
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """
+        Retrieve top-k chunks for several queries with one encode and one FAISS search.
+        """
+        if not queries or self.index is None or self.index.ntotal == 0:
+            return [[] for _ in queries]
+        return self.search(self.encode_queries(queries), top_k=top_k)
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embed queries (normalized float32), e.g. ahead of time while documents are still being indexed.
+        """
+        q_vecs = self.model.encode(queries, batch_size=QUERY_BATCH_SIZE, convert_to_numpy=True,
+                                   normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(q_vecs, dtype="float32")
 
-        q_vec = self.model.encode([query], convert_to_numpy=True)
-        q_vec = np.array(q_vec).astype("float32")
-        faiss.normalize_L2(q_vec)
+    def search(self, q_vecs: np.ndarray, top_k: int = 5) -> List[List[Dict]]:
+        """
+        Retrieve top-k chunks for query vectors from encode_queries().
+        """
+        with self._lock:
+            if len(q_vecs) == 0 or self.index is None or self.index.ntotal == 0:
+                return [[] for _ in q_vecs]
 
-        D, I = self.index.search(q_vec, top_k)
-        results = []
-        for score, idx in zip(D[0], I[0]):
-            if idx < 0:
-                continue
-            results.append({
-                "score": float(score),
-                "meta": self.metadatas[idx],
-                "text": self.texts[idx]
-            })
-        return results
+            D, I = self.index.search(q_vecs, top_k)
+            batch = []
+            for scores, ids in zip(D, I):
+                keep = ids >= 0
+                scores, ids = scores[keep], ids[keep]
+                batch.append([
+                    {
+                        "score": float(score),
+                        "meta": {"filename": filename, "chunk_index": int(chunk_index)},
+                        "text": text
+                    }
+                    for score, filename, chunk_index, text in zip(
+                        scores, self.filenames[ids], self.chunk_indices[ids], self.texts[ids]
+                    )
+                ])
+        return batch
 
 
 # -------------------------------
 # Global default agent (singleton style)
 # -------------------------------
-_default_agent = RetrievalAgent()
+_default_agent: Optional[RetrievalAgent] = None
+
+
+def get_agent() -> RetrievalAgent:
+    """
+    Return the process-wide default agent, creating it on first use.
+    """
+    global _default_agent
+    if _default_agent is None:
+        _default_agent = RetrievalAgent()
+    return _default_agent
 
 
-def index_chunks(chunks: List[Dict]):
+def is_indexed(doc_hash: str, agent: RetrievalAgent = None) -> bool:
+    """
+    Wrapper: check whether a document was already indexed.
+    """
+    return (agent or get_agent()).is_indexed(doc_hash)
+
+
+def index_chunks(chunks: List[Dict], agent: RetrievalAgent = None, doc_hashes: Iterable[str] = ()):
     """
     Wrapper: index new chunks.
     """
-    _default_agent.build_index(chunks)
+    (agent or get_agent()).build_index(chunks, doc_hashes=doc_hashes)
 
 
-def handle_query(query: str, top_k: int = 5) -> List[Dict]:
+def handle_query(query: str, top_k: int = 5, agent: RetrievalAgent = None, q_vec: np.ndarray = None) -> List[Dict]:
     """
     Wrapper: retrieve and send MCP message.
+    q_vec is the query embedding, if it was already computed with encode_queries().
     """
-    top = _default_agent.retrieve(query, top_k=top_k)
+    agent = agent or get_agent()
+    top = agent.retrieve(query, top_k=top_k) if q_vec is None else agent.search(q_vec, top_k=top_k)[0]
     send_mcp_message(
         sender="RetrievalAgent",
         receiver="LLMResponseAgent",
@@ -101,3 +390,18 @@ def handle_query(query: str, top_k: int = 5) -> List[Dict]:
         payload={"retrieved_context": top, "query": query}
     )
     return top
+
+
+def handle_queries(queries: List[str], top_k: int = 5, agent: RetrievalAgent = None) -> List[List[Dict]]:
+    """
+    Wrapper: retrieve for a batch of queries (e.g. evaluation loops) and send one MCP message per query.
+    """
+    batch = (agent or get_agent()).retrieve_batch(queries, top_k=top_k)
+    for query, top in zip(queries, batch):
+        send_mcp_message(
+            sender="RetrievalAgent",
+            receiver="LLMResponseAgent",
+            type="RETRIEVAL_RESULT",
+            payload={"retrieved_context": top, "query": query}
+        )
+    return batch
@@ -0,0 +1,22 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import coordinator_agent
+
+
+def _fake_process_document(path, filename):
+    return [{"text": path, "meta": {"filename": filename, "chunk_index": 0}}]
+
+
+def test_broken_parse_pool_is_replaced(monkeypatch):
+    # Every worker exits during initialization, as when init_worker fails
+    broken = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=os._exit, initargs=(1,))
+    monkeypatch.setattr(coordinator_agent, "_parse_pool", broken)
+    monkeypatch.setattr(coordinator_agent, "process_document", _fake_process_document)
+
+    parsed = asyncio.run(coordinator_agent._parse_documents(["a.txt", "b.txt"]))
+    assert [chunks[0]["text"] for chunks in parsed] == ["a.txt", "b.txt"]
+    assert coordinator_agent._parse_pool is None
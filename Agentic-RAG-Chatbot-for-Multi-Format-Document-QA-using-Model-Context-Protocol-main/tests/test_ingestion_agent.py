@@ -0,0 +1,43 @@
+import re
+
+import ingestion_agent
+from ingestion_agent import RollingChunker, _sentence_chunks
+
+
+class FakeTokenizer:
+    """
+    Whitespace tokenizer with the slice of the HF tokenizer API the chunker uses.
+    """
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False):
+        if isinstance(text, list):
+            return {"input_ids": [self(t)["input_ids"] for t in text]}
+        spans = [m.span() for m in re.finditer(r"\S+", text)]
+        out = {"input_ids": list(range(len(spans)))}
+        if return_offsets_mapping:
+            out["offset_mapping"] = spans
+        return out
+
+
+def test_chunks_have_no_edge_whitespace():
+    text = "  alpha xxx\n\n    beta yyy   \n \n\t gamma " + "w " * 30
+    chunks = _sentence_chunks(text, FakeTokenizer(), max_tokens=3)
+    assert chunks
+    assert all(c == c.strip() for c in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_rolling_chunker_carry_over_is_stripped(monkeypatch):
+    monkeypatch.setattr(ingestion_agent, "_get_tokenizer", FakeTokenizer)
+    pieces = ["one two three\n\n    four five   ", "\n\n  six seven. eight  "] * 20
+    chunks = list(RollingChunker(max_tokens=6, buffer_chars=40).split(pieces))
+    assert all(c == c.strip() for c in chunks)
+    assert " ".join(chunks).split() == "".join(pieces).split()
+
+
+def test_feed_buffers_without_iteration(monkeypatch):
+    monkeypatch.setattr(ingestion_agent, "_get_tokenizer", FakeTokenizer)
+    chunker = RollingChunker(max_tokens=6, buffer_chars=40)
+    for piece in ["one two three. ", "four five six seven. ", "eight nine. "] * 5:
+        chunker.feed(piece)  # completed chunks deliberately ignored
+    assert chunker.flush()  # nothing fed was dropped: the tail is still buffered
@@ -0,0 +1,46 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import llm_response_agent
+from llm_response_agent import extract_stub_answers
+
+TOKENS = [
+    "CAC", "NPS", "Retention rate was ", "churn rate was ", "churn rate decreased to ", "Employee satisfaction ",
+    "carbon footprint ", "$1", "$2.5", "$", " billion", "billion", "2023", "2024", "45", "5%", "7", "%",
+    " ", "\n", "\n\n", "was", "CA", "é", "\xa0", "٤٥", "\x1c",
+]
+
+
+def _random_text(rng):
+    return "".join(rng.choice(TOKENS) for _ in range(rng.randint(1, 12)))
+
+
+def _re_answer(monkeypatch, text):
+    with monkeypatch.context() as m:
+        m.setattr(llm_response_agent, "_HS_DBS", None)
+        return extract_stub_answers(text)
+
+
+def test_stub_answer_revenue_before_cac(monkeypatch):
+    text = "CACNPS$1billionCAcurn rate was 5% 2023"
+    assert extract_stub_answers(text) == "(Stub Answer) Revenue in 2023 was $1billion"
+    assert extract_stub_answers(text) == _re_answer(monkeypatch, text)
+
+
+def test_hyperscan_prefilter_matches_re(monkeypatch):
+    if llm_response_agent._HS_DBS is None:
+        pytest.skip("hyperscan not installed")
+    rng = random.Random(0)
+    for _ in range(100000):
+        text = _random_text(rng)
+        assert extract_stub_answers(text) == _re_answer(monkeypatch, text), repr(text)
+
+
+def test_concurrent_stub_answers():
+    rng = random.Random(1)
+    texts = [_random_text(rng) * 200 for _ in range(160)]
+    expected = [extract_stub_answers(t) for t in texts]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert list(pool.map(extract_stub_answers, texts)) == expected
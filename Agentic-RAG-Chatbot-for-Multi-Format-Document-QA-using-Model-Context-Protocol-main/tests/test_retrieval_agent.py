@@ -0,0 +1,57 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+import retrieval_agent
+from retrieval_agent import EMBED_DIM, MIN_TRAIN_VECTORS, RetrievalAgent
+
+
+class FakeModel:
+    """
+    Deterministic stand-in for the SentenceTransformer: one random unit vector per distinct text.
+    """
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True, normalize_embeddings=True,
+               show_progress_bar=False):
+        if not texts:
+            return np.asarray([], dtype="float32")  # same (0,) shape SentenceTransformer returns
+        vecs = np.stack([
+            np.random.default_rng(int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little"))
+            .standard_normal(EMBED_DIM)
+            for t in texts
+        ]).astype("float32")
+        return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+@pytest.fixture(autouse=True)
+def fake_model(monkeypatch):
+    monkeypatch.setattr(retrieval_agent, "load_embed_model", FakeModel)
+
+
+def _chunks(prefix, n):
+    return [{"text": f"{prefix} {i}", "meta": {"filename": f"{prefix}.txt", "chunk_index": i}} for i in range(n)]
+
+
+def test_duplicate_upload_keeps_mmapped_ivf_index_intact(tmp_path):
+    path = str(tmp_path / "index.faiss")
+    agent = RetrievalAgent(index_path=path)
+    agent.build_index(_chunks("a", MIN_TRAIN_VECTORS), doc_hashes=["a"])
+    assert agent.is_ivf
+
+    agent = RetrievalAgent(index_path=path)  # IVF index memory-mapped from disk
+    agent.build_index(_chunks("a", 10), doc_hashes=["a-copy"])  # only duplicate chunks
+    agent.build_index(_chunks("b", 10), doc_hashes=["b"])
+
+    agent = RetrievalAgent(index_path=path)
+    assert agent.index.ntotal == MIN_TRAIN_VECTORS + 10
+    assert agent.is_indexed("a-copy") and agent.is_indexed("b")
+    assert agent.retrieve("b 3", top_k=1)[0]["text"] == "b 3"
+    assert agent.retrieve("a 7", top_k=1)[0]["text"] == "a 7"
+
+
+def test_empty_query_batch(tmp_path):
+    agent = RetrievalAgent(index_path=str(tmp_path / "index.faiss"))
+    agent.build_index(_chunks("a", 10), doc_hashes=["a"])
+    assert agent.retrieve_batch([]) == []
+    assert retrieval_agent.handle_queries([], agent=agent) == []